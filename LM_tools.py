@@ -1,20 +1,36 @@
 # Standard library imports
+import asyncio
 import json
 import shutil
+import signal
 from datetime import datetime
 import os
 from datetime import datetime
 
 # Third-party imports
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 
-from Python_tool.PythonExecutor_secure import execute_python_code as run_python_code
+from Python_tool.PythonExecutor_secure import PythonExecutor
 from web_tool.web_browsing import text_search as search_web
 from wiki_tool.search_wiki import fetch_wikipedia_content as search_wiki
 
 
-client = OpenAI(base_url="http://127.0.0.1:1234/v1", api_key="lm-studio")
+# Keep connections to the local server open between requests
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    timeout=None
+)
+client = AsyncOpenAI(base_url="http://127.0.0.1:1234/v1", api_key="lm-studio", http_client=http_client)
 MODEL = "lmstudio-community/qwen2.5-7b-instruct"
+MAX_PARALLEL_TOOLS = 4
+
+# One executor per session so variables and imports carry over between tool calls
+python_executor = PythonExecutor()
+PYTHON_WARMUP_CODE = "import numpy as np\nimport math\nimport statistics"
+
+# Separator line for tool output, refreshed when the terminal is resized instead of on every tool call
+separator = "-" * shutil.get_terminal_size().columns
 
 Tools = [{
     "type": "function",
@@ -72,65 +88,209 @@ Tools = [{
     }
 }]
 
-def process_stream(stream, add_assistant_label=True):
-    """Handle streaming responses from the API"""
-    collected_text = ""
-    tool_calls = []
+def join_tool_call(parts):
+    """Build a tool call from its streamed fragments"""
+    return {
+        "id": "".join(parts["id_parts"]),
+        "type": "function",
+        "function": {
+            "name": "".join(parts["name_parts"]),
+            "arguments": "".join(parts["arg_parts"])
+        }
+    }
+
+async def process_stream(stream, start_tool, add_assistant_label=True):
+    """
+    Handle streaming responses from the API.
+    Each tool call is started with start_tool as soon as the model moves on to the next one,
+    so tools run while the rest of the response is still streaming.
+    Returns the text, the tool calls and one task per tool call.
+    """
+    text_parts = []
+    tool_call_parts = []
+    tool_tasks = []
     first_chunk = True
 
-    for chunk in stream:
-        delta = chunk.choices[0].delta
+    def start_ready_tools(count):
+        while len(tool_tasks) < count:
+            tool_tasks.append(asyncio.create_task(start_tool(join_tool_call(tool_call_parts[len(tool_tasks)]))))
 
-        # Handle regular text output
-        if delta.content:
-            if first_chunk:
-                print()
-                if add_assistant_label:
-                    print("Assistant:", end=" ", flush=True)
-                first_chunk = False
-            print(delta.content, end="", flush=True)
-            collected_text += delta.content
-
-        # Handle tool calls
-        elif delta.tool_calls:
-            for tc in delta.tool_calls:
-                if len(tool_calls) <= tc.index:
-                    tool_calls.append({
-                        "id": "", "type": "function",
-                        "function": {"name": "", "arguments": ""}
-                    })
-                tool_calls[tc.index] = {
-                    "id": (tool_calls[tc.index]["id"] + (tc.id or "")),
-                    "type": "function",
-                    "function": {
-                        "name": (tool_calls[tc.index]["function"]["name"] + (tc.function.name or "")),
-                        "arguments": (tool_calls[tc.index]["function"]["arguments"] + (tc.function.arguments or ""))
-                    }
-                }
-    return collected_text, tool_calls
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta
+
+            # Handle regular text output
+            if delta.content:
+                if first_chunk:
+                    print()
+                    if add_assistant_label:
+                        print("Assistant:", end=" ", flush=True)
+                    first_chunk = False
+                print(delta.content, end="", flush=True)
+                text_parts.append(delta.content)
+
+            # Handle tool calls, collecting fragments and joining them once each call is complete
+            elif delta.tool_calls:
+                for tc in delta.tool_calls:
+                    # A fragment for a later call means every earlier call is complete
+                    start_ready_tools(min(tc.index, len(tool_call_parts)))
+                    while len(tool_call_parts) <= tc.index:
+                        tool_call_parts.append({"id_parts": [], "name_parts": [], "arg_parts": []})
+                    parts = tool_call_parts[tc.index]
+                    if tc.id:
+                        parts["id_parts"].append(tc.id)
+                    if tc.function and tc.function.name:
+                        parts["name_parts"].append(tc.function.name)
+                    if tc.function and tc.function.arguments:
+                        parts["arg_parts"].append(tc.function.arguments)
+    except BaseException:
+        for task in tool_tasks:
+            task.cancel()
+        raise
+
+    start_ready_tools(len(tool_call_parts))
+    tool_calls = [join_tool_call(parts) for parts in tool_call_parts]
+    return "".join(text_parts), tool_calls, tool_tasks
+
+def update_separator(*_):
+    global separator
+    separator = "-" * shutil.get_terminal_size().columns
 
-def chat_loop():
+# Progress lines from tool threads, handed to the main loop so only it prints
+main_loop = None
+progress_lines = None
+
+def report_site(site):
+    """Queue a line for each website as it is fetched, while the rest are still loading"""
+    # Only chat_loop prints progress; handle_web called from anywhere else stays quiet
+    if main_loop is None or main_loop.is_closed():
+        return
+    status = "Fetched" if "content" in site else "Failed to fetch"
+    main_loop.call_soon_threadsafe(progress_lines.put_nowait, f"{status}: {site['url']}")
+
+def handle_python(arguments):
+    code = arguments["code"]
+    result = python_executor.execute(code, timeout=5)
+    lines = ["\n" + separator, code, separator]
+    if result["success"]:
+        if result["output"]:
+            lines.append(f"Output:\n{result['output']}")
+        if result["result"] is not None:
+            lines.append(f"Result:\n{result['result']}")
+    else:
+        lines.append(f"Error running and executing the code\n{result['error']}")
+    lines.append(separator)
+    return result, lines
+
+def handle_web(arguments):
+    query = arguments["query"]
+    embedding_matcher = arguments["embedding_matcher"]
+    number_of_websites = arguments.get("number_of_websites", 3)
+    number_of_citations = arguments.get("number_of_citations", 5)
+    result = search_web(query, embedding_matcher, number_of_websites, number_of_citations, on_progress=report_site)
+    lines = ["\n" + separator]
+    if result:
+        lines.append(f"Search Query: '{query}', embedding_matcher: '{embedding_matcher}'")
+        lines.append(f"Visited ({number_of_websites}) websites and returned ({number_of_citations}) results")
+        for idx, website in enumerate(result):
+            lines.append(f"URL {idx}: {website['url']}\n{website['citation']}")
+    else:
+        lines.append(f"\nError fetching websites content: {query}")
+    lines.append(separator)
+    return result, lines
+
+def handle_wiki(arguments):
+    result = search_wiki(arguments["search_query"])
+    lines = ["\n" + separator]
+    if result["status"] == "success":
+        lines.extend([f"Wikipedia article: {result['title']}", separator, result["content"]])
+    else:
+        lines.append(f"\nError fetching Wikipedia content: {result['message']}")
+    lines.append(separator)
+    return result, lines
+
+# Tool name -> handler taking the parsed arguments and returning (result, lines to print)
+HANDLERS = {
+    "run_python_code": handle_python,
+    "search_web": handle_web,
+    "search_wiki": handle_wiki,
+}
+
+def execute_tool_call(tool_call):
+    """Run a single tool call and return its result with the text to print"""
+    name = tool_call["function"]["name"]
+    handler = HANDLERS.get(name)
+    if handler is None:
+        result = {"status": "error", "message": f"Unknown tool: {name}"}
+        return result, result["message"]
+
+    result, lines = handler(json.loads(tool_call["function"]["arguments"]))
+    return result, "\n".join(lines)
+
+async def run_tool_call(tool_call, semaphore):
+    """Run one tool call in a worker thread, at most MAX_PARALLEL_TOOLS at a time"""
+    async with semaphore:
+        return await asyncio.to_thread(execute_tool_call, tool_call)
+
+async def collect_tool_results(tool_tasks):
+    """
+    Wait for the tool tasks, returning (result, output) pairs in call order.
+    Progress lines queued by the tools are printed while waiting.
+    """
+    gathered = asyncio.ensure_future(asyncio.gather(*tool_tasks, return_exceptions=True))
+    while not gathered.done():
+        next_line = asyncio.ensure_future(progress_lines.get())
+        await asyncio.wait({gathered, next_line}, return_when=asyncio.FIRST_COMPLETED)
+        if next_line.done():
+            print(next_line.result())
+        else:
+            next_line.cancel()
+    while not progress_lines.empty():
+        print(progress_lines.get_nowait())
+
+    results = gathered.result()
+    return [
+        (result, f"\nError running tool: {result}") if isinstance(result, Exception) else result
+        for result in results
+    ]
+
+async def chat_loop():
+    global main_loop, progress_lines
+    main_loop = asyncio.get_running_loop()
+    progress_lines = asyncio.Queue()
     messages = []
+    if hasattr(signal, "SIGWINCH"):
+        signal.signal(signal.SIGWINCH, update_separator)
+    # Import common modules once so later snippets don't pay for them
+    python_executor.execute(PYTHON_WARMUP_CODE, timeout=30)
     print("Assistant: What can I help you with?")
 
     while True:
         user_input = input("\nYou: ").strip()
         if user_input.lower() == "quit":
             break
+        if user_input.lower() == "/reset":
+            python_executor.reset_state()
+            python_executor.execute(PYTHON_WARMUP_CODE, timeout=30)
+            print("Python state cleared.")
+            continue
 
         messages.append({"role": "user", "content": user_input})
         continue_tool_execution = True
 
         while continue_tool_execution:
-            # Get response
-            response = client.chat.completions.create(
+            # Get response, starting tools while it streams
+            semaphore = asyncio.Semaphore(MAX_PARALLEL_TOOLS)
+            response = await client.chat.completions.create(
                 model=MODEL,
                 messages=messages,
                 tools=Tools,
                 stream=True,
                 temperature=0.2
             )
-            response_text, tool_calls = process_stream(response)
+            response_text, tool_calls, tool_tasks = await process_stream(
+                response, lambda tool_call: run_tool_call(tool_call, semaphore)
+            )
 
             if not tool_calls:
                 print()
@@ -149,69 +309,15 @@ def chat_loop():
                 print(f"Calling Tool: {tool_name}")
                 messages.append({"role": "assistant", "tool_calls": tool_calls})
 
-                # Execute tool calls
-                for tool_call in tool_calls:
-                    arguments = json.loads(tool_call["function"]["arguments"])
-
-                    if tool_call["function"]["name"] == "run_python_code":
-                        result = run_python_code(arguments["code"])
-                        messages.append({
-                            "role": "tool",
-                            "content": str(result),
-                            "tool_call_id": tool_call["id"]
-                        })
-                        terminal_width = shutil.get_terminal_size().columns
-                        print("\n" + "-" * terminal_width)
-                        print(arguments["code"])
-                        print("-" * terminal_width)
-                        if result["success"]:
-                            if result["output"]:
-                                print(f"Output:\n{result['output']}")
-                            if result["result"] is not None:
-                                print(f"Result:\n{result['result']}")
-                        else:
-                            print(f"Error running and executing the code\n{result['error']}")
-                        print("-" * terminal_width)
-
-                    elif tool_call["function"]["name"] == "search_web":
-                        result = search_web(
-                            arguments["query"],
-                            arguments["embedding_matcher"],
-                            arguments.get("number_of_websites", 3),
-                            arguments.get("number_of_citations", 5)
-                        )
-                        messages.append({
-                            "role": "tool",
-                            "content": str(result),
-                            "tool_call_id": tool_call["id"]
-                        })
-                        terminal_width = shutil.get_terminal_size().columns
-                        print("\n" + "-" * terminal_width)
-                        if result:
-                            print(f"Search Query: '{arguments['query']}', embedding_matcher: '{arguments['embedding_matcher']}'")
-                            print(f"Visited ({arguments.get('number_of_websites', 3)}) websites and returned ({arguments.get('number_of_citations', 5)}) results")
-                            for idx, website in enumerate(result):
-                                print(f"URL {idx}: {website['url']}\n{website['citation']}")
-                        else:
-                            print(f"\nError fetching websites content: {arguments['query']}")
-                        print("-" * terminal_width)
-
-                    elif tool_call["function"]["name"] == "search_wiki":
-                        result = search_wiki(arguments["search_query"])
-                        messages.append({
-                            "role": "tool",
-                            "content": str(result),
-                            "tool_call_id": tool_call["id"]
-                        })
-                        terminal_width = shutil.get_terminal_size().columns
-                        print("\n" + "-" * terminal_width)
-                        if result["status"] == "success":
-                            print(f"Wikipedia article: {result['title']}")
-                            print("-" * terminal_width)
-                            print(result["content"])
-                        else:
-                            print(f"\nError fetching Wikipedia content: {result['message']}")
-                        print("-" * terminal_width)
+                # Wait for the tool calls, then report them in call order
+                results = await collect_tool_results(tool_tasks)
+                for tool_call, (result, output) in zip(tool_calls, results):
+                    messages.append({
+                        "role": "tool",
+                        "content": str(result),
+                        "tool_call_id": tool_call["id"]
+                    })
+                    print(output)
 
                 # Continue checking for more tool calls after tool execution
                 continue_tool_execution = True
@@ -219,4 +325,7 @@ def chat_loop():
                 continue_tool_execution = False
 
 if __name__ == "__main__":
-    chat_loop()
+    try:
+        asyncio.run(chat_loop())
+    finally:
+        python_executor.close()
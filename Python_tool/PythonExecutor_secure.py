@@ -1,57 +1,79 @@
 from io import StringIO
+import ast
 import traceback
 from typing import Dict, Optional, Tuple, Generator
 import contextlib
+from itertools import islice
+import math
+import multiprocessing
 import sys
-import json
 import threading
-import ctypes
 import re
 
-class ThreadWithException(threading.Thread):
-    """A Thread subclass that can be stopped by forcing an exception."""
-    
-    def _get_id(self):
-        # Returns the thread ID
-        if hasattr(self, '_thread_id'):
-            return self._thread_id
-        for id, thread in threading._active.items():
-            if thread is self:
-                self._thread_id = id
-                return id
-
-    def raise_exception(self):
-        """Raises KeyboardInterrupt in the thread to stop it."""
-        thread_id = self._get_id()
-        if thread_id is not None:
-            res = ctypes.pythonapi.PyThreadState_SetAsyncExc(
-                ctypes.c_long(thread_id),
-                ctypes.py_object(KeyboardInterrupt)
-            )
-            if res > 1:
-                # If more than one exception was raised, something went wrong
-                ctypes.pythonapi.PyThreadState_SetAsyncExc(
-                    ctypes.c_long(thread_id),
-                    None
-                )
-                raise RuntimeError("Failed to stop thread")
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    """Return 'a.b.c' for an attribute chain on a plain name, otherwise None"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return '.'.join(reversed(parts))
+
+# Workers may be restarted from a tool thread, and forking a multi-threaded process can deadlock the child
+_mp_context = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+def _worker_main(connection):
+    """Run parsed snippets received over connection, keeping their globals between calls"""
+    exec_globals = {'__builtins__': __builtins__}
+    while True:
+        try:
+            tree = connection.recv()
+        except EOFError:
+            return
+        result = PythonExecutor._execute_code(tree, exec_globals)
+        try:
+            connection.send(make_json_serializable(result))
+        except Exception as e:
+            # A result that can't be converted or pickled must not take the worker and its globals down with it
+            connection.send({
+                'success': False,
+                'output': str(result['output']),
+                'error': f"Could not return the result: {type(e).__name__}: {e}",
+                'result': None
+            })
 
 class PythonExecutor:
     """
     A tool for safely executing Python code and capturing its output.
-    Windows-compatible version with timeout support.
+    Code runs in a long-lived worker process that keeps its globals between calls.
+    The worker is killed on timeout and restarted on the next call, which loses that state.
     """
-    
+
     def __init__(self):
-        self.global_state: Dict = {}
-        self.execution_result = None
-        self.blocked_imports = ["os", "sys", "subprocess", "shutil"]
+        self._process = None
+        self._connection = None
+        self._lock = threading.Lock()
+        # builtins and io re-export exec/open under another name
+        self.blocked_imports = ["os", "sys", "subprocess", "shutil", "builtins", "io"]
         self.blocked_keywords = [
-            "exec", "eval", "open", "os.system", "subprocess", "ctypes", "importlib" , "input"
+            "exec", "eval", "open", "os.system", "subprocess", "ctypes", "importlib" , "input", "__import__",
+            "__builtins__", "globals", "locals", "vars", "getattr"
         ]
+        self.blocked_names = frozenset(self.blocked_keywords)
+        # Members that reach the OS through any module re-exporting os, e.g. pathlib.os.system
+        self.blocked_attributes = frozenset(self.blocked_imports) | self.blocked_names | {"system", "popen", "_os"}
+        # Cheap rejection of the common import forms before the tree is walked, compiled once
+        self._blocked_import_re = re.compile(
+            rf"\b(?:import|from)\s+(?:{'|'.join(map(re.escape, self.blocked_imports))})\b"
+        )
 
+    @staticmethod
     @contextlib.contextmanager
-    def _capture_output(self) -> Generator[Tuple[StringIO, StringIO], None, None]:
+    def _capture_output() -> Generator[Tuple[StringIO, StringIO], None, None]:
         """Capture stdout and stderr"""
         new_out, new_err = StringIO(), StringIO()
         old_out, old_err = sys.stdout, sys.stderr
@@ -61,77 +83,76 @@ class PythonExecutor:
         finally:
             sys.stdout, sys.stderr = old_out, old_err
 
-    def _is_code_safe(self, code: str) -> bool:
-        """Check if the provided code contains unsafe imports or keywords."""
-        # Check for blocked imports
-        for module in self.blocked_imports:
-            if re.search(rf"\bimport\s+{module}\b|\bfrom\s+{module}\b", code):
-                return False
+    def _is_code_safe(self, code: str, tree: ast.Module) -> bool:
+        """Check if the provided code and its parsed tree contain unsafe imports or keywords."""
+        if self._blocked_import_re.search(code):
+            return False
 
-        # Check for blocked keywords
-        for keyword in self.blocked_keywords:
-            if keyword in code:
-                return False
+        blocked_modules = set(self.blocked_imports) | self.blocked_names
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                if any(alias.name.split('.')[0] in blocked_modules for alias in node.names):
+                    return False
+            elif isinstance(node, ast.ImportFrom):
+                if node.module and node.module.split('.')[0] in blocked_modules:
+                    return False
+                # Catches e.g. from somewhere import exec as run
+                if any(alias.name in self.blocked_names for alias in node.names):
+                    return False
+            elif isinstance(node, ast.Name):
+                # Catches calls such as eval(...) as well as aliases such as f = eval
+                if node.id in self.blocked_names:
+                    return False
+            elif isinstance(node, ast.Attribute):
+                # Catches os.system, x.open on any object such as io.open, and re-exported modules such as pathlib.os
+                if node.attr in self.blocked_attributes or _dotted_name(node) in self.blocked_names:
+                    return False
+                # Dunder attributes such as __subclasses__ lead back to the builtins
+                if node.attr.startswith('__') and node.attr.endswith('__'):
+                    return False
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+                # Catches lookups by string key, such as x['__builtins__']['open']
+                if node.value in self.blocked_attributes:
+                    return False
 
         return True
 
-    def _execute_code(self, code: str):
-        """Execute code and store the result"""
+    @staticmethod
+    def _execute_code(tree: ast.Module, exec_globals: Dict) -> Dict:
+        """Execute parsed code in the worker process within exec_globals and return the result"""
         result = {
             'success': False,
             'output': '',
             'error': None,
             'result': None
         }
+        # Run everything but a trailing expression, which is evaluated for the result
+        body, last_expr = tree.body, None
+        if body and isinstance(body[-1], ast.Expr):
+            body, last_expr = body[:-1], ast.fix_missing_locations(ast.Expression(body=body[-1].value))
 
-        # Security check
-        if not self._is_code_safe(code):
-            result['error'] = "SecurityError: Unsafe code detected"
-            self.execution_result = result
-            return
-        
-        with self._capture_output() as (out, err):
+        with PythonExecutor._capture_output() as (out, err):
             try:
-                # Execute the code within the global state
-                exec_globals = {
-                    '__builtins__': __builtins__,
-                    **self.global_state
-                }
-                
-                # Try to compile the code first to catch syntax errors
-                compiled_code = compile(code, '<string>', 'exec')
-                
-                # Execute the code
-                exec(compiled_code, exec_globals)
-                
-                # Update global state
-                self.global_state.update(exec_globals)
-                
+                exec(compile(ast.Module(body=body, type_ignores=[]), '<string>', 'exec'), exec_globals)
+                if last_expr is not None:
+                    result['result'] = eval(compile(last_expr, '<string>', 'eval'), exec_globals)
+
                 # Get output
                 result['output'] = out.getvalue()
                 result['success'] = True
-                
-                # Try to get the last expression result
-                # Split by both newlines and semicolons
-                lines = [line.strip() for line in re.split(r'[;\n]', code) if line.strip()]
-                if lines:
-                    try:
-                        last_expr = compile(lines[-1], '<string>', 'eval')
-                        result['result'] = eval(last_expr, exec_globals)
-                    except:
-                        pass
-                    
-            except KeyboardInterrupt:
-                result['error'] = 'Execution timed out'
-                result['output'] = out.getvalue()
-            except Exception as e:
+
+            except (Exception, SystemExit) as e:
                 result['error'] = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
                 result['output'] = out.getvalue()
 
-        if not is_json_serializable(result):
-            result = make_json_serializable(result)
-        self.execution_result = result
-            
+        return result
+
+    def _start_worker(self):
+        self._connection, child_connection = _mp_context.Pipe()
+        self._process = _mp_context.Process(target=_worker_main, args=(child_connection,), daemon=True)
+        self._process.start()
+        child_connection.close()
+
     def execute(self, code: str, timeout: Optional[int] = 10) -> Dict:
         """
         Execute Python code with timeout and return the results.
@@ -144,36 +165,65 @@ class PythonExecutor:
             Dictionary containing execution results
         """
         if timeout is None or timeout <= 0:
-            timeout = float('inf')
-        
-        # Create and start execution thread
-        execution_thread = ThreadWithException(target=self._execute_code, args=(code,))
-        execution_thread.start()
-        
-        # Wait for completion or timeout
-        execution_thread.join(timeout)
-        
-        # If thread is still alive after join, it's running too long
-        if execution_thread.is_alive():
-            execution_thread.raise_exception()
-            execution_thread.join()
+            timeout = None
+
+        try:
+            tree = ast.parse(code, '<string>')
+        except SyntaxError as e:
             return {
                 'success': False,
                 'output': '',
-                'error': f'Execution timed out after {timeout} seconds',
+                'error': f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}",
                 'result': None
             }
-            
-        return self.execution_result or {
-            'success': False,
-            'output': '',
-            'error': 'Execution failed with no result',
-            'result': None
-        }
-    
+
+        # Security check
+        if not self._is_code_safe(code, tree):
+            return {
+                'success': False,
+                'output': '',
+                'error': "SecurityError: Unsafe code detected",
+                'result': None
+            }
+
+        # Calls share the worker's globals, so they run one at a time
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                self._start_worker()
+            try:
+                self._connection.send(tree)
+                if not self._connection.poll(timeout):
+                    # Kill the worker; a fresh one is started on the next call
+                    self.close()
+                    return {
+                        'success': False,
+                        'output': '',
+                        'error': f'Execution timed out after {timeout} seconds',
+                        'result': None
+                    }
+                return self._connection.recv()
+            except (EOFError, OSError) as e:
+                # The worker died, e.g. from a crash in a C extension
+                self.close()
+                return {
+                    'success': False,
+                    'output': '',
+                    'error': f'Execution failed: worker process exited ({type(e).__name__})',
+                    'result': None
+                }
+
+    def close(self):
+        """Terminate the worker process, discarding its globals"""
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+            self._connection.close()
+            self._process = None
+            self._connection = None
+
     def reset_state(self):
-        """Clear the stored global state"""
-        self.global_state = {}
+        """Clear the stored global state by starting a fresh worker on the next call"""
+        self.close()
 
 # Example usage
 def execute_python_code(code: str, timeout: int = 5) -> dict:
@@ -192,19 +242,17 @@ def execute_python_code(code: str, timeout: int = 5) -> dict:
         - result: Last evaluated expression result
     """
     executor = PythonExecutor()
-    return executor.execute(code, timeout)
-
-def is_json_serializable(data):
     try:
-        json.dumps(data)
-        return True
-    except (TypeError, OverflowError):
-        return False
+        return executor.execute(code, timeout)
+    finally:
+        executor.close()
 
 import numpy as np
 def make_json_serializable(data):
     """
     Convert non-JSON-serializable data to a JSON-serializable format.
+    Data that is already serializable is returned as-is, so it is walked once and never copied.
+    Non-finite floats become strings, since they are not valid JSON.
     
     Args:
         data: The data to convert.
@@ -213,20 +261,40 @@ def make_json_serializable(data):
         The JSON-serializable data.
     """
     if isinstance(data, np.ndarray):
-        return data.tolist()
+        return make_json_serializable(data.tolist())
     elif isinstance(data, (set,)):
-        return list(data)
+        return make_json_serializable(list(data))
     elif isinstance(data, (bytes, bytearray)):
-        return data.decode('utf-8')
+        return data.decode('utf-8', errors='replace')
     elif isinstance(data, (complex,)):
-        return [data.real, data.imag]
+        return make_json_serializable([data.real, data.imag])
     elif isinstance(data, (np.generic,)):
-        return data.item()
+        return make_json_serializable(data.item())
     elif isinstance(data, (dict,)):
-        return {make_json_serializable(k): make_json_serializable(v) for k, v in data.items()}
-    elif isinstance(data, (list, tuple)):
+        # The copy is only started at the first key or value that changes
+        converted = None
+        for i, (key, value) in enumerate(data.items()):
+            new_key = key if isinstance(key, (str, int, float, bool, type(None))) else str(key)
+            new_value = make_json_serializable(value)
+            if converted is None and (new_key is not key or new_value is not value):
+                converted = dict(islice(data.items(), i))
+            if converted is not None:
+                converted[new_key] = new_value
+        return data if converted is None else converted
+    elif isinstance(data, (list,)):
+        converted = None
+        for i, item in enumerate(data):
+            new_item = make_json_serializable(item)
+            if converted is None and new_item is not item:
+                converted = data[:i]
+            if converted is not None:
+                converted.append(new_item)
+        return data if converted is None else converted
+    elif isinstance(data, (tuple,)):
         return [make_json_serializable(item) for item in data]
-    elif isinstance(data, (int, float, str, bool, type(None))):
+    elif isinstance(data, float):
+        return data if math.isfinite(data) else str(data)
+    elif isinstance(data, (int, str, bool, type(None))):
         return data
     else:
-        return str(data)
\ No newline at end of file
+        return str(data)
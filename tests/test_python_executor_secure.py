@@ -0,0 +1,63 @@
+import unittest
+
+from Python_tool.PythonExecutor_secure import PythonExecutor
+
+
+class TestCodeSafety(unittest.TestCase):
+    def setUp(self):
+        self.executor = PythonExecutor()
+
+    def tearDown(self):
+        self.executor.close()
+
+    def assertBlocked(self, code):
+        result = self.executor.execute(code)
+        self.assertFalse(result['success'], code)
+        self.assertEqual(result['error'], "SecurityError: Unsafe code detected", code)
+
+    def test_blocks_aliased_exec_from_builtins(self):
+        self.assertBlocked("from builtins import exec as run; run('import o'+'s; print(o'+'s.getcwd())')")
+
+    def test_blocks_open_through_builtins_module(self):
+        self.assertBlocked("import builtins; builtins.open('/etc/hostname').read()")
+
+    def test_blocks_open_through_io(self):
+        self.assertBlocked("import io; io.open('/etc/hostname').read()")
+
+    def test_blocks_blocked_names_imported_from_any_module(self):
+        self.assertBlocked("from somewhere import open")
+
+    def test_blocks_blocked_attribute_on_any_object(self):
+        self.assertBlocked("import pathlib; pathlib.Path('/etc/hostname').open().read()")
+
+    def test_blocks_builtins_dict(self):
+        self.assertBlocked("__builtins__['ex' + 'ec']('x = 1')")
+
+    def test_blocks_os_reexported_by_another_module(self):
+        self.assertBlocked("import pathlib\npathlib.os.system('echo PWNED >&2')")
+        self.assertBlocked("import pathlib\npathlib.os.popen('id').read()")
+
+    def test_blocks_builtins_through_globals(self):
+        self.assertBlocked("globals()['__builtins__']['open']('/etc/hostname').read()")
+
+    def test_blocks_introspection_helpers_and_dunder_attributes(self):
+        for code in ("vars()", "locals()", "getattr(str, 'join')", "().__class__.__base__.__subclasses__()",
+                     "import shlex\nshlex._os"):
+            self.assertBlocked(code)
+
+    def test_blocks_blocked_names_as_strings(self):
+        self.assertBlocked("d = {'open': 1}")
+
+    def test_blocks_direct_imports_and_calls(self):
+        for code in ("import os", "from os.path import join", "import numpy, os", "__import__('os')",
+                     "eval('1')", "f = eval", "import ctypes", "os.system('ls')"):
+            self.assertBlocked(code)
+
+    def test_allows_words_containing_blocked_names(self):
+        result = self.executor.execute('x = "execute the opening"\nx')
+        self.assertTrue(result['success'], result['error'])
+        self.assertEqual(result['result'], "execute the opening")
+
+
+if __name__ == '__main__':
+    unittest.main()
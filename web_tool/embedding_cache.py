@@ -0,0 +1,112 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+def quantize(vector) -> Tuple[float, np.ndarray]:
+    """
+    L2-normalize a vector and quantize it to int8 with one symmetric scale.
+    The original direction is recovered as vector * scale.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    vector = vector / (np.linalg.norm(vector) + 1e-12)
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return scale, np.round(vector / scale).astype(np.int8)
+
+
+class EmbeddingCache:
+    """
+    A content-addressed on-disk cache of embedding vectors.
+
+    Vectors are keyed on a hash of the model name and the embedded text and are
+    stored L2-normalized as int8 with a float scale in a SQLite file, so a
+    repeated chunk costs one lookup instead of an embeddings request.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None):
+        """
+        Parameters:
+        - path (str): Location of the SQLite file, created if missing.
+        - ttl_seconds (float): Entries older than this are recomputed. None keeps them forever.
+        """
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, scale REAL NOT NULL, vector BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        if ttl_seconds is not None:
+            self._connection.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - ttl_seconds,))
+        self._connection.commit()
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        """Content hash of a text, shared by chunk deduplication and the cache key."""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=32).digest()
+
+    @staticmethod
+    def _key(digest: bytes, model: str) -> bytes:
+        return hashlib.blake2b(model.encode("utf-8") + b"\0" + digest, digest_size=32).digest()
+
+    def _lookup(self, keys: List[bytes]) -> dict:
+        """Fetch the stored vectors for keys that are present and not expired."""
+        oldest = time.time() - self.ttl_seconds if self.ttl_seconds is not None else float("-inf")
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's limit on bound parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, scale, vector, created FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                for key, scale, vector, created in rows:
+                    if created >= oldest:
+                        found[key] = (scale, np.frombuffer(vector, dtype=np.int8))
+        return found
+
+    def _store(self, items: dict):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, scale, vector, created) VALUES (?, ?, ?, ?)",
+                [(key, scale, vector.tobytes(), now) for key, (scale, vector) in items.items()],
+            )
+            self._connection.commit()
+
+    def get_or_compute_many(self, texts: List[str], model: str,
+                            compute_batch: Callable[[List[str]], list],
+                            digests: Optional[List[bytes]] = None) -> List[Tuple[float, np.ndarray]]:
+        """
+        Return one embedding per text, computing only the cache misses.
+
+        Parameters:
+        - texts (list of str): The texts to embed.
+        - model (str): The embedding model name, part of the cache key.
+        - compute_batch (callable): Embeds a list of texts, returning one vector per text.
+        - digests (list of bytes): digest() of each text, if the caller already computed them.
+
+        Returns:
+        - list of (float, np.ndarray): quantize() output for each text, in the same order as texts.
+        """
+        if digests is None:
+            digests = [self.digest(text) for text in texts]
+        keys = [self._key(digest, model) for digest in digests]
+        found = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            computed = {key: quantize(vector) for key, vector in zip(missing, compute_batch(list(missing.values())))}
+            self._store(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
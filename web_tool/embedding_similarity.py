@@ -1,63 +1,185 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from typing import List, Optional, Tuple, Union
+
+import httpx
 import numpy as np
 from openai import OpenAI
 
-# Initialize the OpenAI client
-client = OpenAI(base_url="http://192.168.1.3:1234/v1", api_key="lm-studio")
+from web_tool.embedding_cache import EmbeddingCache
+
+# Initialize the OpenAI client, keeping connections open between embedding requests
+http_client = httpx.Client(
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+    timeout=None
+)
+client = OpenAI(base_url="http://192.168.1.3:1234/v1", api_key="lm-studio", http_client=http_client)
 
-def get_embedding(text, model="Embed_model"):
-    text = text.replace("\n", " ")
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+EMBEDDING_MODEL = "Embed_model"
+EMBEDDING_BATCH_SIZE = 64
+# Sites embedded at the same time, so the local embedding server isn't flooded
+MAX_CONCURRENT_SITES = 4
 
-def cosine_similarity(vec1, vec2):
-    sim =  np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
-    return sim
+# Chunks scraped before are looked up here instead of being embedded again
+embedding_cache = EmbeddingCache(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3"),
+    ttl_seconds=30 * 24 * 60 * 60,
+)
 
-def find_most_similar_content(data: list, prompt: str, top_n: int =3):
+def get_embedding(text: Union[str, List[str]], model=EMBEDDING_MODEL):
+    """
+    Embed one text or a list of texts.
+    Lists are sent in batches of EMBEDDING_BATCH_SIZE, one request per batch.
+    Returns a single vector for a string input and a list of vectors for a list input.
+    """
+    texts = [text] if isinstance(text, str) else list(text)
+    texts = [t.replace("\n", " ") for t in texts]
+
+    embeddings = []
+    for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        response = client.embeddings.create(input=texts[i:i + EMBEDDING_BATCH_SIZE], model=model)
+        embeddings.extend(d.embedding for d in sorted(response.data, key=lambda d: d.index))
+
+    return embeddings[0] if isinstance(text, str) else embeddings
+
+def _embed_cached(texts: List[str], digests: Optional[List[bytes]] = None):
+    return embedding_cache.get_or_compute_many(texts, EMBEDDING_MODEL, get_embedding, digests)
+
+def _embed_groups(groups: List[Tuple[List[str], Optional[List[bytes]]]]):
+    """Embed each (texts, digests) group in its own thread, MAX_CONCURRENT_SITES groups at a time, in input order."""
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_SITES, len(groups))) as executor:
+        return list(executor.map(lambda group: _embed_cached(*group), groups))
+
+def cosine_similarity(embeddings, query, block_size=1024):
+    """
+    Cosine similarity between quantized embeddings and a quantized query, with float32 matmuls.
+    Both are (scale, int8 vector) pairs from the embedding cache, already L2-normalized.
+    Rows are dequantized a block at a time into one reused float32 buffer, and the
+    per-row scales are applied to the scores rather than to the matrix.
+    """
+    scales = np.array([scale for scale, _ in embeddings], dtype=np.float32)
+    vectors = [vector for _, vector in embeddings]
+    query_scale, query_vector = query
+    query_vector = query_vector.astype(np.float32) * np.float32(query_scale)
+
+    scores = np.empty(len(vectors), dtype=np.float32)
+    buffer = np.empty((min(block_size, len(vectors)), len(query_vector)), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        block = buffer[:len(vectors[start:start + block_size])]
+        np.stack(vectors[start:start + block_size], out=block)
+        scores[start:start + len(block)] = block @ query_vector
+    return scores * scales
+
+def top_n_indices(similarities, top_n):
+    """Indices of the top_n highest similarities, sorted in descending order."""
+    if top_n < len(similarities):
+        top = np.argpartition(-similarities, top_n)[:top_n]
+    else:
+        top = np.arange(len(similarities))
+    return top[np.argsort(-similarities[top], kind="stable")]
+
+# Scoring kernel for topk_cosine, built on first use so importing this module never imports numba
+_cosine_scores = None
+
+def _load_cosine_scores():
+    global _cosine_scores
+    if _cosine_scores is not None:
+        return _cosine_scores
+
+    try:
+        from numba import njit, prange
+    except ImportError:
+        # numba is optional, fall back to NumPy without it
+        def cosine_scores(matrix, query):
+            """Normalized dot product of every row of matrix with query."""
+            norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12
+            return (matrix @ query) / norms
+    else:
+        @njit(parallel=True, fastmath=True, cache=True, nogil=True)
+        def cosine_scores(matrix, query):
+            """Fused normalize and dot product of every row of matrix with query."""
+            query_norm = np.sqrt(np.sum(query * query)) + 1e-12
+            scores = np.empty(matrix.shape[0], dtype=np.float32)
+            for i in prange(matrix.shape[0]):
+                dot = 0.0
+                norm = 0.0
+                for j in range(matrix.shape[1]):
+                    dot += matrix[i, j] * query[j]
+                    norm += matrix[i, j] * matrix[i, j]
+                scores[i] = dot / ((np.sqrt(norm) + 1e-12) * query_norm)
+            return scores
+
+    _cosine_scores = cosine_scores
+    return _cosine_scores
+
+def topk_cosine(matrix, query, k):
+    """
+    Top k rows of a float embedding matrix by cosine similarity to query, for vectors that don't come from the cache.
+    Uses a JIT-compiled kernel that runs without the GIL when numba is installed.
+    Returns the row indices and their similarities, in descending order.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    query = np.ascontiguousarray(query, dtype=np.float32)
+    scores = _load_cosine_scores()(matrix, query)
+    top = top_n_indices(scores, k)
+    return top, scores[top]
+
+def find_most_similar_content(data: list, prompt: str, top_n: int =3, use_cache: bool = True):
     """
     Find the most similar content to a given query from a list of data.
     Args:
         data (list): A list of dictionaries, where each dictionary contains a 'content' key with text data and a 'url' key with url source of the text.
         query (str): The query string to compare against the content in the data.
         top_n (int, optional): The number of top similar items to return. Defaults to 3.
+        use_cache (bool, optional): Look up and store embeddings in the embedding cache. Defaults to True.
     Returns:
         list: A list of the top_n most similar items from the data, sorted by similarity in descending order.
     """
+    # spliting drops chunks repeated across pages (menus, footers), so each is embedded and ranked once
     data = spliting(data)
-   
-    query_embedding = get_embedding(prompt)
-    similarities = []
-
-    for item in data:
-        content_embedding = get_embedding(item['citation'])
-        similarity = cosine_similarity(query_embedding, content_embedding)
-        similarities.append((item, similarity))
+    if not data or top_n <= 0:
+        return []
 
-    # Sort by similarity in descending order and select the top_n
-    similarities.sort(key=lambda x: x[1], reverse=True)
-    most_similar = [item[0] for item in similarities[:top_n]]
+    if not use_cache:
+        query_embedding, *content_embeddings = get_embedding([prompt] + [item['citation'] for item in data])
+        top, _ = topk_cosine(content_embeddings, query_embedding, top_n)
+    else:
+        # One group per site plus one for the prompt, so their embedding requests overlap
+        site_groups = [
+            ([item['citation'] for item in items], [item['digest'] for item in items])
+            for items in (list(items) for _, items in groupby(data, key=lambda item: item['url']))
+        ]
+        [query_embedding], *site_embeddings = _embed_groups([([prompt], None)] + site_groups)
+        content_embeddings = [embedding for embeddings in site_embeddings for embedding in embeddings]
+        top = top_n_indices(cosine_similarity(content_embeddings, query_embedding), top_n)
 
-    return most_similar
+    return [{"url": data[i]['url'], "citation": data[i]['citation']} for i in top]
 
 def divide_into_chunks(text, chunk_size=250, overlap=25):
-    # Split the text into individual words
-    words = text.split()
-    
-    # Calculate the start and end indices for each chunk
-    chunks = []
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        if chunk:  # Ensure that the chunk is not empty (happens at the very end)
-            chunks.append(chunk)
-    
-    return chunks
+    """
+    Yield chunks of chunk_size words, each overlapping the previous one by overlap words.
+    Chunks are sliced from the original text at recorded word offsets instead of re-joining word lists.
+    """
+    # Start offset of every word, plus the end of the text
+    offsets = [match.start() for match in re.finditer(r'\S+', text)]
+    word_count = len(offsets)
+    offsets.append(len(text))
+
+    for i in range(0, word_count, chunk_size - overlap):
+        yield text[offsets[i]:offsets[min(i + chunk_size, word_count)]].rstrip()
 
 def spliting(results: list):
-# devide list of dict into chunks with form of list of dict
+# devide list of dict into chunks with form of list of dict, hashing each chunk in the same pass
+# a chunk already seen earlier (on this page or a previous one) is skipped so it is never embedded twice
    chunks = []
+   seen = set()
    for result in results:
       if "content" in result:
-         one_site_chunks = []
-         one_site_chunks.extend(divide_into_chunks(result["content"]))
-         for chunk in one_site_chunks:
-               chunks.append({"url": result["url"], "citation": chunk})
-   return chunks
\ No newline at end of file
+         for chunk in divide_into_chunks(result["content"]):
+               digest = EmbeddingCache.digest(chunk)
+               if digest not in seen:
+                  seen.add(digest)
+                  chunks.append({"url": result["url"], "citation": chunk, "digest": digest})
+   return chunks
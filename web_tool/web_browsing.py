@@ -8,7 +8,7 @@ ddg = DuckDuckGoSearchManager()
 scraper = WebContentScraper()
 
 
-def text_search(query: str, prompt, num_websites: int = 4, citations: int = 5) -> str:
+def text_search(query: str, prompt, num_websites: int = 4, citations: int = 5, on_progress=None) -> str:
     """Conducts a general web text search and retrieves information from the internet in response to user queries.
 
     This function is best used when the user's query is seeking broad information available on various websites. It
@@ -19,6 +19,7 @@ def text_search(query: str, prompt, num_websites: int = 4, citations: int = 5) -
 
     :param query: The search query string for finding relevant web text results.
     :param num_results: The maximum number of URLs to return. Defaults to 3 if not provided. (optional)
+    :param on_progress: Called with each scraped site, in search order, as it is fetched and before ranking. (optional)
 
     :return: A JSON-formatted string. Each element in the JSON represents the result of scraping a single URL,
     containing either the scraped content or an error message.
@@ -28,7 +29,11 @@ def text_search(query: str, prompt, num_websites: int = 4, citations: int = 5) -
         citations = min(citations, 10)        # Maximum 10 citations
         
         urls = ddg.text_search(query, int(num_websites))
-        scraped_data = scraper.scrape_multiple_websites(urls)
+        scraped_data = []
+        for site in scraper.iter_scrape_multiple_websites(urls):
+            scraped_data.append(site)
+            if on_progress:
+                on_progress(site)
         filtered_data = find_most_similar_content(scraped_data, prompt, citations)
     except Exception as e:
         return {"url": "error", "citation": str(e)}
@@ -1,6 +1,7 @@
 import json
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from bs4 import BeautifulSoup
@@ -82,6 +83,21 @@ class WebContentScraper:
                 return {"url": url, "error": "Failed to parse content"}
         return {"url": url, "error": "Failed to fetch page content"}
 
+    def iter_scrape_multiple_websites(self, urls, max_workers=8):
+        """Scrapes multiple websites concurrently, yielding each result once it and every earlier URL are done.
+
+        Parameters:
+        - urls (list of str): A list of URLs of the websites to be scraped.
+        - max_workers (int): The maximum number of pages fetched at the same time.
+
+        Yields:
+        - dict: The result of scrape_website for each URL, in the same order as urls.
+        """
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+            yield from executor.map(self.scrape_website, urls)
+
     def scrape_multiple_websites(self, urls):
         """Scrapes the content from multiple websites.
 
@@ -93,10 +109,7 @@ class WebContentScraper:
           of scraping a single URL, containing either the scraped content or an error message.
         """
         try:
-            content = []
-            for url in urls:
-                content.append(self.scrape_website(url))
-            return content
+            return list(self.iter_scrape_multiple_websites(urls))
         except Exception as e:
             logging.error(f"Error during scraping multiple websites: {e}")
             return json.dumps({"error": str(e)})